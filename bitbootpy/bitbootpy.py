@@ -2,13 +2,18 @@
 
 from __future__ import annotations
 
-from typing import Dict, List, Tuple, Optional, Union, Type, TYPE_CHECKING
-from tenacity import retry, wait_fixed, stop_after_attempt
+from typing import Any, Awaitable, Dict, List, Sequence, Tuple, Optional, Union, Type, TYPE_CHECKING
+from collections import OrderedDict
+import functools
 import hashlib
+import random
 import datetime
+import time
 import logging
 import asyncio
-from bitbootpy.bitbootpy.dht_manager import DHTManager
+import sys
+import weakref
+from bitbootpy.dht_manager import BT_DHT_DOMAINS, GET_TIMEOUT, IO_EXECUTOR, DHTManager
 
 if TYPE_CHECKING:
     from bitbootpy.bitbootpy import BitBoot
@@ -19,34 +24,162 @@ logging.basicConfig(level=logging.INFO)
 # All this needs to do is write to the BT, or some other network's, DHT
 
 
+DEFAULT_BOOTSTRAP_NODES = BT_DHT_DOMAINS
+
+
+@functools.lru_cache(maxsize=4096)
+def _info_hash(network_name: str) -> bytes:
+    # Network names are a small fixed set; hash each one only once per
+    # process. The digest is only used as a DHT key, not for security.
+    return hashlib.sha1(network_name.encode(), usedforsecurity=False).digest()
+
+
+def _info_hashes(network_names: Sequence[str]) -> List[bytes]:
+    # Hash a whole list of names in one pass, e.g. right after loading them
+    # from a file, so later lookups and announces only hit the cache
+    return [_info_hash(name) for name in network_names]
+
+
+# Canonical peer tuples, so repeat sightings across rounds share one object
+_peer_intern: Dict[tuple, tuple] = {}
+
+
+def _intern_peer(peer: tuple) -> tuple:
+    return _peer_intern.setdefault(peer, peer)
+
+
+def _encode_peer(host: str, port: int) -> str:
+    # kademlia only stores int, float, bool, str and bytes values
+    return f"{host}:{port}"
+
+
+def _decode_peers(value: Any) -> List[tuple]:
+    # The interned (host, port) peers in a value read from a network's key
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if not isinstance(value, str):
+        return []
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit():
+        return []
+    return [_intern_peer((host, int(port)))]
+
+
+async def gather_cancel_on_error(coros: List[Awaitable]) -> List:
+    # Like asyncio.gather, but cancels the remaining tasks as soon as one of
+    # them fails and waits for them to unwind before re-raising
+    # (asyncio.TaskGroup semantics, which needs Python 3.11+)
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# Releases scheduled by garbage-collected BitBoot instances, kept alive here
+# until they finish
+_pending_releases: set = set()
+
+
+def _release_on_collect(dht_manager: DHTManager) -> None:
+    # Safety net for instances dropped without aclose(): the release has to
+    # run on the loop that owns the server, so without one there is nothing
+    # safe to do during garbage collection or interpreter shutdown
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(dht_manager.arelease())
+    _pending_releases.add(task)
+    task.add_done_callback(_pending_releases.discard)
+
+
+def _write_peers(found: List[Tuple[str, set]], now: str, verbose: bool) -> None:
+    # Format every peer once and issue a single write per peers file, plus
+    # one stdout write for all networks in the batch
+    output = []
+    for network_name, peers in found:
+        lines = [f"{peer}\n" for peer in peers]
+        with open(f"{network_name}_peers.txt", "w") as f:
+            f.write("".join(lines))
+        if verbose and lines:
+            prefix = f"[{now}] {network_name}: "
+            output.append(prefix + prefix.join(lines))
+    if output:
+        sys.stdout.write("".join(output))
+        sys.stdout.flush()
+
+
+def _with_retry(error_message: str):
+    # Retries a BitBoot coroutine method with jittered exponential backoff,
+    # bounded by the instance's max_retries, read at call time. Applied to
+    # the class rather than stored per instance, so it doesn't tie each
+    # BitBoot into a reference cycle that only the cyclic GC can free.
+    # Plain loop instead of tenacity, so the no-error path costs a single
+    # await. Waits are capped at 30 seconds.
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            attempts = max(1, self._config.max_retries)
+            for attempt in range(attempts):
+                try:
+                    return await fn(self, *args, **kwargs)
+                except (OSError, RuntimeError, asyncio.TimeoutError):
+                    if attempt + 1 >= attempts:
+                        break
+                    await asyncio.sleep(random.uniform(0, min(30, 2 ** attempt)))
+            logging.error(error_message)
+        return wrapper
+    return decorator
+
+
 class BitBootConfig:
     def __init__(
         self,
-        bootstrap_nodes: Optional[List[Tuple[str, int]]] = None,
+        bootstrap_nodes: Optional[Sequence[Tuple[str, int]]] = None,
         rate_limit_delay: float = 1.0,
         max_retries: int = 3,
         retry_delay: float = 5.0,
         continuous_mode: Optional[Dict[str, bool]] = None,
         network_names: Optional[List[str]] = None,
         print_discovered_peers: bool = True,
+        lookup_cache_ttl: float = 300.0,
+        lookup_cache_size: int = 128,
+        bypass_cache: bool = False,
+        max_concurrent_queries: int = 16,
+        peer_ttl: float = 3600.0,
+        min_interval: Optional[float] = None,
+        max_interval: float = 300.0,
+        max_stable_rounds: int = 2,
+        dht_ksize: int = 20,
+        dht_alpha: int = 3,
     ):
-        self.bootstrap_nodes = bootstrap_nodes or [
-            ("router.utorrent.com", 6881),
-            ("router.bittorrent.com", 6881),
-            ("dht.transmissionbt.com", 6881),
-            ("dht.aelitis.com", 6881),
-        ]
+        self.bootstrap_nodes = tuple(bootstrap_nodes) if bootstrap_nodes else DEFAULT_BOOTSTRAP_NODES
         self.rate_limit_delay = rate_limit_delay
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.continuous_mode = continuous_mode or {}
         self.network_names = network_names or []
         self.print_discovered_peers = print_discovered_peers
+        self.lookup_cache_ttl = lookup_cache_ttl
+        self.lookup_cache_size = lookup_cache_size
+        self.bypass_cache = bypass_cache
+        self.max_concurrent_queries = max_concurrent_queries
+        self.peer_ttl = peer_ttl
+        self.min_interval = rate_limit_delay if min_interval is None else min_interval
+        self.max_interval = max_interval
+        self.max_stable_rounds = max_stable_rounds
+        self.dht_ksize = dht_ksize
+        self.dht_alpha = dht_alpha
 
     def load_network_names_from_file(self, file_path: str) -> None:
         with open(file_path, "r") as f:
-            network_names = [line.strip() for line in f.readlines()]
-            self.network_names = network_names
+            network_names = [name for name in map(str.strip, f) if name]
+        self.network_names = network_names
+        _info_hashes(network_names)
 
 
 class BitBoot:
@@ -57,12 +190,25 @@ class BitBoot:
         network_names: Optional[List[str]] = None,
     ):
         self._config = config or BitBootConfig()
-        self._dht_manager = DHTManager(self._config.bootstrap_nodes)
+        self._dht_manager = DHTManager.acquire(
+            self._config.bootstrap_nodes, self._config.dht_ksize, self._config.dht_alpha)
+        self._closed = False
+        self._finalizer = weakref.finalize(self, _release_on_collect, self._dht_manager)
+        self._query_sem: Optional[asyncio.Semaphore] = None
 
         # Reconcile constructor args with BitBootConfig values
         self._continuous_mode = continuous_mode or self._config.continuous_mode
-        self._discovered_peers = {name: set() for name in self._network_names}
+        self._poll_interval: Dict[str, float] = {}
+        self._next_poll_at: Dict[str, float] = {}
         self._network_names = network_names or self._config.network_names
+        # network name -> {peer: monotonic time it was last seen}, with an
+        # entry for every configured network from the start
+        self._discovered_peers: Dict[str, Dict[tuple, float]] = {
+            name: {} for name in self._network_names}
+        # Precompute info hashes for the configured networks up front
+        _info_hashes(self._network_names)
+        # info_hash -> (monotonic timestamp, peers), least recently used first
+        self._lookup_cache: OrderedDict[bytes, Tuple[float, frozenset]] = OrderedDict()
 
     @classmethod
     async def create(cls,
@@ -72,16 +218,21 @@ class BitBoot:
                      ) -> BitBoot:
 
         instance = cls(config, continuous_mode, network_names)
+        await instance._dht_manager._bootstrap_dht()
+        return instance
 
-        instance._dht_manager = yield DHTManager.create(instance._config.bootstrap_nodes)
-        # why not just await this?
-        instance._bootstrap_dht_task = asyncio.create_task(
-            instance._dht_manager._bootstrap_dht())
+    async def __aenter__(self) -> BitBoot:
+        return self
 
-        return instance
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
 
-    def __del__(self):
-        self._dht_manager.stop()
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._finalizer.detach()
+        await self._dht_manager.arelease()
 
     # -----------------------
     # Util
@@ -100,52 +251,237 @@ class BitBoot:
         await self.announce_peer(network_names=[network_name], port=port)
         await self.lookup(network_names=[network_name])
 
+    @staticmethod
     def load_network_names_from_file(filename: str) -> List[str]:
         with open(filename, "r") as f:
-            return [line.strip() for line in f.readlines()]
+            return [name for name in map(str.strip, f) if name]
 
     def _generate_info_hash(self, network_name: str) -> bytes:
-        return hashlib.sha1(network_name.encode()).digest()
+        return _info_hash(network_name)
 
     def num_peers(self) -> Dict[str, int]:
+        self._expire_peers()
         return {name: len(peers) for name, peers in self._discovered_peers.items()}
 
+    def get_peers(self, network_name: str) -> List[tuple]:
+        # Freshest peers first
+        self._expire_peers()
+        peers = self._discovered_peers.get(network_name, {})
+        return sorted(peers, key=peers.__getitem__, reverse=True)
+
+    def _expire_peers(self) -> None:
+        cutoff = time.monotonic() - self._config.peer_ttl
+        for peers in self._discovered_peers.values():
+            stale = [peer for peer, last_seen in peers.items() if last_seen < cutoff]
+            for peer in stale:
+                del peers[peer]
+                _peer_intern.pop(peer, None)
+
+    def _get_query_sem(self) -> asyncio.Semaphore:
+        # Caps the number of in-flight DHT queries so large network lists
+        # don't flood the local socket or trip router rate limits. The window
+        # is shared by every call on this instance and is held around each
+        # query only, not the delays and retries between them, so a new query
+        # starts as soon as any running one finishes. Created lazily so it
+        # binds to the running loop.
+        if self._query_sem is None:
+            self._query_sem = asyncio.Semaphore(self._config.max_concurrent_queries)
+        return self._query_sem
+
     # -----------------------
     # Lookup
     # -----------------------
-    async def lookup(self, network_name: str, num_searches: int = 10, delay: int = 5):
+    async def lookup(self, network_names: Union[str, List[str]], num_searches: int = 10, delay: int = 5, min_peers: int = 0, deadline_s: Optional[float] = None):
         if isinstance(network_names, str):
             network_names = [network_names]
 
+        # Each network's peer set is created here rather than inside the
+        # retried _lookup_single, so peers found before a failed attempt
+        # carry over into the retry instead of being thrown away
         tasks = []
         for network_name in network_names:
             tasks.append(self._lookup_single(
-                network_name, num_searches, delay))
+                network_name, num_searches, delay, min_peers, deadline_s, set()))
 
-        await asyncio.gather(*tasks)
+        await gather_cancel_on_error(tasks)
 
-    @retry(wait=wait_fixed(5), stop=stop_after_attempt(3), retry_error_callback=lambda _: logging.error("Failed to lookup network"))
-    async def _lookup_single(self, network_name: str, num_searches: int, delay: int) -> None:
+    @_with_retry("Failed to lookup network")
+    async def _lookup_single(self, network_name: str, num_searches: int, delay: int, min_peers: int = 0, deadline_s: Optional[float] = None,
+                             found_peers: Optional[set] = None) -> None:
         info_hash = self._generate_info_hash(network_name)
-        found_peers = set()
 
-        for _ in range(num_searches):
-            await asyncio.sleep(delay)
-            results = await self._dht_manager._server.get(info_hash)
+        # Serve repeated lookups from the cache while the entry is fresh
+        cached = self._get_cached_peers(info_hash)
+        if cached is not None:
+            self._remember_peers(network_name, cached)
+            return
+
+        if found_peers is None:
+            found_peers = set()
+
+        # Query straight away and only wait `delay` between rounds; stop as
+        # soon as the caller has enough peers instead of always running
+        # num_searches rounds.
+        # Also stop once the lookup has converged, i.e. max_stable_rounds
+        # rounds in a row turned up no new peers.
+        # Everything that stays the same between rounds is resolved up front
+        dht_get = self._dht_manager.get
+        query_sem = self._get_query_sem()
+        peers_arrived = asyncio.Event()
+        on_late_result = self._late_peers_callback(network_name, found_peers, peers_arrived)
+        max_stable_rounds = self._config.max_stable_rounds
+
+        async def _search_rounds():
+            stable_rounds = 0
+            for search in range(num_searches):
+                if search:
+                    # Sleep between rounds, but move on as soon as a late
+                    # answer brings in new peers
+                    try:
+                        await asyncio.wait_for(peers_arrived.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    peers_arrived.clear()
+                    if min_peers and len(found_peers) >= min_peers:
+                        return
+                known = len(found_peers)
+                async with query_sem:
+                    results = await dht_get(info_hash, on_late_result)
+                if results:
+                    found_peers.update(_decode_peers(results))
+                if min_peers and len(found_peers) >= min_peers:
+                    return
+                stable_rounds = stable_rounds + 1 if len(found_peers) == known else 0
+                if stable_rounds >= max_stable_rounds:
+                    return
+
+        # Slow DHT gets can't stretch the lookup past its deadline either.
+        # By default every round may take its delay plus a full get timeout,
+        # so only a lookup that is actually stuck runs into it.
+        if deadline_s is None:
+            deadline_s = num_searches * (delay + GET_TIMEOUT)
+        completed = True
+        try:
+            await asyncio.wait_for(_search_rounds(), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            completed = False
+            logging.info(f"Lookup deadline reached for {network_name}, keeping peers found so far")
+
+        await self._record_peers([(network_name, info_hash, found_peers)], cacheable=completed)
+
+    @_with_retry("Failed to lookup networks")
+    async def lookup_many(self, network_names: List[str], deadline_s: float = 60.0, num_searches: int = 10, delay: int = 5,
+                          info_hashes: Optional[List[bytes]] = None) -> None:
+        # Run the lookups for every network side by side each round against
+        # the shared routing table, instead of one network after the other.
+        # Callers polling the same networks repeatedly can pass the info
+        # hashes they resolved once. Retried like lookup(), so a transient
+        # socket error doesn't end continuous mode.
+        if info_hashes is None:
+            info_hashes = _info_hashes(network_names)
+        names_by_hash = dict(zip(info_hashes, network_names))
+        found_peers: Dict[bytes, set] = {info_hash: set() for info_hash in names_by_hash}
+        info_hashes = list(found_peers)
+        late_callbacks = {
+            info_hash: self._late_peers_callback(name, found_peers[info_hash])
+            for info_hash, name in names_by_hash.items()}
+
+        def _on_late_result(info_hash: bytes, results) -> None:
+            late_callbacks[info_hash](results)
+
+        get_many = self._dht_manager.get_many
+        query_sem = self._get_query_sem()
+        max_stable_rounds = self._config.max_stable_rounds
+
+        async def _search_rounds():
+            stable_rounds = 0
+            for search in range(num_searches):
+                if search:
+                    await asyncio.sleep(delay)
+                known = sum(map(len, found_peers.values()))
+                results = await get_many(info_hashes, _on_late_result, query_sem)
+                for info_hash, result in zip(info_hashes, results):
+                    if result:
+                        found_peers[info_hash].update(_decode_peers(result))
+                # Stop once no network has turned up new peers for a while
+                if sum(map(len, found_peers.values())) == known:
+                    stable_rounds += 1
+                    if stable_rounds >= max_stable_rounds:
+                        return
+                else:
+                    stable_rounds = 0
+
+        completed = True
+        try:
+            await asyncio.wait_for(_search_rounds(), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            completed = False
+            logging.info("Lookup deadline reached, keeping peers found so far")
+
+        await self._record_peers([
+            (names_by_hash[info_hash], info_hash, peers) for info_hash, peers in found_peers.items()],
+            cacheable=completed)
+
+    def _late_peers_callback(self, network_name: str, found_peers: set, arrived: Optional[asyncio.Event] = None):
+        # Fold answers that arrive after a get timed out into the lookup's
+        # results and the known peers for the network, and wake up a lookup
+        # waiting on `arrived` if they brought new peers
+        def _on_late_result(results) -> None:
             if results:
-                for peer in results:
-                    found_peers.add(peer)
-
-        # Update the discovered peers for this network
-        self._discovered_peers[network_name] = found_peers
-
-        # Write discovered peers to a file and print to stdout if enabled
+                late_peers = set(_decode_peers(results))
+                known = len(found_peers)
+                found_peers.update(late_peers)
+                self._remember_peers(network_name, late_peers)
+                if arrived is not None and len(found_peers) > known:
+                    arrived.set()
+
+        return _on_late_result
+
+    async def _record_peers(self, found: List[Tuple[str, bytes, set]], cacheable: bool = True) -> None:
+        # Late DHT answers keep adding to the lookups' peer sets on the loop,
+        # so the cache and the writer thread each get a snapshot instead
+        found = [(network_name, info_hash, frozenset(found_peers))
+                 for network_name, info_hash, found_peers in found]
+
+        # Update the discovered peers for each network. Only complete,
+        # non-empty results are cached: an empty or deadline-truncated
+        # lookup shouldn't stop the next one from asking the DHT again.
+        for network_name, info_hash, found_peers in found:
+            self._remember_peers(network_name, found_peers)
+            if cacheable and found_peers:
+                self._cache_peers(info_hash, found_peers)
+
+        # Write discovered peers to files and print to stdout if enabled, in
+        # one hop off the event loop thread for the whole batch
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(f"{network_name}_peers.txt", "w") as f:
-            for peer in found_peers:
-                f.write(f"{peer}\n")
-                if self.config.print_discovered_peers:
-                    print(f"[{now}] {network_name}: {peer}")
+        await asyncio.get_running_loop().run_in_executor(
+            IO_EXECUTOR, _write_peers, [(network_name, found_peers) for network_name, _, found_peers in found],
+            now, self._config.print_discovered_peers)
+
+    def _remember_peers(self, network_name: str, found_peers: set) -> None:
+        # Keep peers seen in earlier rounds and refresh the ones seen again
+        now = time.monotonic()
+        self._discovered_peers.setdefault(network_name, {}).update(
+            dict.fromkeys(found_peers, now))
+
+    def _get_cached_peers(self, info_hash: bytes) -> Optional[frozenset]:
+        if self._config.bypass_cache:
+            return None
+        entry = self._lookup_cache.get(info_hash)
+        if entry is None:
+            return None
+        timestamp, peers = entry
+        if time.monotonic() - timestamp >= self._config.lookup_cache_ttl:
+            del self._lookup_cache[info_hash]
+            return None
+        self._lookup_cache.move_to_end(info_hash)
+        return peers
+
+    def _cache_peers(self, info_hash: bytes, peers: frozenset) -> None:
+        self._lookup_cache[info_hash] = (time.monotonic(), peers)
+        self._lookup_cache.move_to_end(info_hash)
+        while len(self._lookup_cache) > self._config.lookup_cache_size:
+            self._lookup_cache.popitem(last=False)
 
     # -----------------------
     # Announce
@@ -159,29 +495,77 @@ class BitBoot:
         for network_name in network_names:
             tasks.append(self._announce_peer_single(network_name, port))
 
-        await asyncio.gather(*tasks)
+        await gather_cancel_on_error(tasks)
 
-    @retry(wait=wait_fixed(5), stop=stop_after_attempt(3), retry_error_callback=lambda _: logging.error("Failed to announce peer"))
+    @_with_retry("Failed to announce peer")
     async def _announce_peer_single(self, network_name: str, port: int) -> None:
         info_hash = self._generate_info_hash(network_name)
 
         # set for the network name, your IP and port
         host = self._dht_manager.get_server(
         ).transport.get_extra_info('sockname')[0]
-        await self._dht_manager._server.set(info_hash, (host, port))
+        async with self._get_query_sem():
+            await self._dht_manager._server.set(info_hash, _encode_peer(host, port))
+        # New data just landed under this key, don't serve a stale lookup
+        self._lookup_cache.pop(info_hash, None)
 
     # -----------------------
     # Continuous Mode
     # -----------------------
-    async def start_continuous_mode(self, network_name: str):
-        if network_name not in self._network_names:
-            raise ValueError(
-                f"Network name '{network_name}' is not configured")
-
-        self._continuous_mode[network_name] = True
-        while self._continuous_mode[network_name]:
-            await self.lookup([network_name])
-            await asyncio.sleep(self._config.rate_limit_delay)
+    async def start_continuous_mode(self, network_names: Union[str, List[str], None] = None):
+        if network_names is None:
+            network_names = self._network_names
+        elif isinstance(network_names, str):
+            network_names = [network_names]
+
+        for network_name in network_names:
+            if network_name not in self._network_names:
+                raise ValueError(
+                    f"Network name '{network_name}' is not configured")
+            self._continuous_mode[network_name] = True
+
+            self._poll_interval[network_name] = self._config.min_interval
+            self._next_poll_at[network_name] = time.monotonic()
+
+        # Resolve everything the loop needs once for the whole run
+        info_hash_by_name = dict(zip(network_names, _info_hashes(network_names)))
+        lookup_many = self.lookup_many
+        continuous_mode = self._continuous_mode
+        discovered_peers = self._discovered_peers
+        poll_interval = self._poll_interval
+        next_poll_at = self._next_poll_at
+        min_interval = self._config.min_interval
+        max_interval = self._config.max_interval
+        monotonic = time.monotonic
+
+        # Each cycle runs one combined lookup for the networks that are due.
+        # A network that turns up new peers is polled again after
+        # min_interval; one that doesn't backs off towards max_interval.
+        while True:
+            active = [name for name in network_names if continuous_mode[name]]
+            if not active:
+                break
+
+            now = monotonic()
+            due = [name for name in active if next_poll_at[name] <= now]
+            if due:
+                # Peers are only ever added or refreshed by a lookup, so a
+                # larger count afterwards means new peers turned up
+                known = {name: len(discovered_peers.get(name, ())) for name in due}
+                await lookup_many(
+                    due, info_hashes=[info_hash_by_name[name] for name in due])
+                now = monotonic()
+                for name in due:
+                    if len(discovered_peers.get(name, ())) > known[name]:
+                        poll_interval[name] = min_interval
+                    else:
+                        poll_interval[name] = min(poll_interval[name] * 1.5, max_interval)
+                    next_poll_at[name] = now + poll_interval[name]
+                self._expire_peers()
+
+            # Wake up at least every min_interval to notice stop requests
+            wake_at = min(next_poll_at[name] for name in active)
+            await asyncio.sleep(min(max(0.0, wake_at - monotonic()), min_interval))
 
     def stop_continuous_mode(self, network_name: str):
         self._continuous_mode[network_name] = False
@@ -1,23 +1,32 @@
 # BitBootPY - Fully-Decentralized Peer Discovery For P2P Networks
 
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional, Union, Type, TYPE_CHECKING
-import hashlib
-import datetime
-import json
-from kademlia.network import Server
-# from twisted.internet import reactor, defer, asyncioreactor
-# from twisted.names import client
-from tenacity import retry, wait_fixed, stop_after_attempt
-import logging
+from typing import List, Optional
 import argparse
-from asyncio import gather, create_task, run
+import asyncio
 import sys
 
-from bitbootpy.bitbootpy import BitBoot 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig, gather_cancel_on_error
+
+
+_PARSER: Optional[argparse.ArgumentParser] = None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    global _PARSER
+    if _PARSER is not None:
+        return _PARSER
 
-async def main(argv: List[str]):
     parser = argparse.ArgumentParser(
         description="BitBoot: A tool for decentralized peer discovery in P2P networks"
     )
@@ -59,46 +68,56 @@ async def main(argv: List[str]):
         help="Load network names from a file (one name per line)",
     )
     parser.add_argument(
-       "--print-discovered-peers",
+        "--print-discovered-peers",
         action="store_true",
         help="Print discovered peers to stdout",
     )
 
-    args = parser.parse_args(argv)
+    _PARSER = parser
+    return parser
+
 
-    config = BitBootConfig(print_discovered_peers=args.print_discovered_peers)
+async def main(argv: List[str]):
+    parser = build_parser()
+    args = parser.parse_args(argv)
 
+    # Nothing to do, don't bother joining the DHT
+    if not (args.announce or args.lookup or args.continuous):
+        parser.print_help()
+        return
 
+    loaded_config = {}
     if args.config:
         # Load configuration from the file
-        with open(args.config, "r") as f:
-            loaded_config = json.load(f)
-        config = BitBootConfig(**loaded_config)
+        with open(args.config, "rb") as f:
+            loaded_config = _json.loads(f.read())
+
+    # The command-line flag takes precedence over the configuration file
+    if args.print_discovered_peers or "print_discovered_peers" not in loaded_config:
+        loaded_config["print_discovered_peers"] = args.print_discovered_peers
+    config = BitBootConfig(**loaded_config)
 
     if args.network_names_file:
         config.load_network_names_from_file(args.network_names_file)
 
-    async with BitBoot.create(config=config) as bitboot:
-
-        async def run_async_tasks():
-            tasks = []
-            if args.announce:
-                for network_name in args.announce:
-                    tasks.append(bitboot.announce(network_name, args.port))
-            if args.lookup:
-                for network_name in args.lookup:
-                    tasks.append(bitboot.lookup(network_name))
-            if args.continuous:
-                for network_name in args.continuous:
-                    tasks.append(bitboot.start_continuous_mode(network_name))
-
-            if tasks:
-                await gather(*tasks)
-
-        if args.announce or args.lookup or args.continuous:
-            create_task(run_async_tasks())
-        else:
-            parser.print_help()
-    
+    async with await BitBoot.create(config=config) as bitboot:
+        tasks = []
+        if args.announce:
+            tasks.append(bitboot.announce_peer(args.announce, args.port))
+        if args.lookup:
+            tasks.append(bitboot.lookup(args.lookup))
+        if args.continuous:
+            tasks.append(bitboot.start_continuous_mode(args.continuous))
+
+        await gather_cancel_on_error(tasks)
+
+
+def run():
+    # Continuous mode is timer-heavy, so run on uvloop when it is installed
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(main(sys.argv[1:]))
+
+
 if __name__ == "__main__":
-    run(main(sys.argv[1:]))
+    run()
@@ -1,57 +1,496 @@
 from __future__ import annotations
-from typing import List, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from kademlia.crawling import NodeSpiderCrawl
 from kademlia.network import Server
+from kademlia.utils import digest
 import asyncio
+import functools
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import pickle
+import random
+import socket
+import statistics
+import threading
+import time
 
-BT_DHT_DOMAINS = [
+# The single list of default bootstrap nodes, also used by BitBootConfig
+BT_DHT_DOMAINS = (
+    ("router.utorrent.com", 6881),
+    ("router.bittorrent.com", 6881),
     ("dht.transmissionbt.com", 6881),
-    ("dht.u-phoria.org", 6881),
-    ("dht.bt.am", 2710),
-    ("dht.ipred.org", 6969),
-    ("dht.pirateparty.gr", 80),
-    ("dht.zoink.nl", 80),
-    ("dht.openbittorrent.com", 80),
-    ("dht.istole.it", 6969),
-    ("dht.ccc.de", 80),
-    ("dht.leechers-paradise.org", 6969)
-]
+    ("dht.aelitis.com", 6881),
+)
+
+DHT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".bitboot")
+DHT_STATE_SAVE_INTERVAL = 600
+DHT_PORT = 5678
+DHT_KSIZE = 20
+DHT_ALPHA = 3
+BOOTSTRAP_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".bitboot", "bootstrap.json")
+BOOTSTRAP_CACHE_TTL = 24 * 60 * 60
+BOOTSTRAP_NODE_TIMEOUT = 3.0
+BOOTSTRAP_CONCURRENCY = 16
+BOOTSTRAP_ATTEMPTS = 3
+BOOTSTRAP_BACKOFF_BASE = 3.0
+BOOTSTRAP_BACKOFF_MAX = 10.0
+REBOOTSTRAP_INTERVAL = 300
+GET_TIMEOUT = 10.0
+GET_MIN_TIMEOUT = 1.0
+GET_RTT_SAMPLES = 256
+GET_MIN_RTT_SAMPLES = 16
+
+# Small dedicated pool for BitBoot's blocking file I/O (peer lists, caches,
+# DHT state), so it neither competes with nor is starved by other users of
+# the loop's default executor
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bitboot-io")
+
+
+def _read_bootstrap_cache() -> Dict[str, List]:
+    try:
+        with open(BOOTSTRAP_CACHE_PATH, "r") as f:
+            cached = json.load(f)
+        if time.time() - cached["resolved_at"] < BOOTSTRAP_CACHE_TTL:
+            # Drop IPv6 entries written before resolution was limited to IPv4
+            return {key: node for key, node in cached["nodes"].items() if "." in node[0]}
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def _write_bootstrap_cache(nodes: Dict[str, List]) -> None:
+    try:
+        os.makedirs(os.path.dirname(BOOTSTRAP_CACHE_PATH), exist_ok=True)
+        with open(BOOTSTRAP_CACHE_PATH, "w") as f:
+            json.dump({"resolved_at": time.time(), "nodes": nodes}, f)
+    except OSError as e:
+        logging.warning(f"Failed to cache bootstrap nodes: {e}")
+
+
+def _manager_key(bootstrap_nodes: Sequence[Tuple[str, int]], ksize: int, alpha: int) -> Tuple:
+    return (tuple(sorted(tuple(node) for node in bootstrap_nodes)), ksize, alpha)
+
+
+def _read_state(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _write_state(path: str, data: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(data, f)
+    except OSError as e:
+        logging.warning(f"Failed to save DHT state to {path}: {e}")
+
+
+@functools.lru_cache(maxsize=256)
+def _is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _ignore_result(task: asyncio.Future) -> None:
+    # Retrieve the outcome of a task nobody awaits any more, so a failure
+    # isn't reported as a never-retrieved exception
+    if not task.cancelled():
+        task.exception()
 
 
 class DHTManager:
-    def __init__(self, bootstrap_nodes: List[Tuple[str, int]] = BT_DHT_DOMAINS):
-        self._server = Server()
+    # Process-wide managers shared between BitBoot instances, keyed by their
+    # bootstrap nodes and lookup parameters so each DHT is only joined once
+    _instances: Dict[Tuple, DHTManager] = {}
+    _instances_lock = threading.Lock()
+
+    __slots__ = ("_server", "_ksize", "_alpha", "_bootstrap_nodes", "_state_path", "_refcount",
+                 "_key", "_get_rtts", "_get_timeout", "_started", "_router",
+                 "_rebootstrap_handle", "_rebootstrap_task", "_join_lock", "_save_state_handle")
+
+    def __init__(self, bootstrap_nodes: List[Tuple[str, int]] = BT_DHT_DOMAINS, state_dir: Optional[str] = DHT_STATE_DIR,
+                 ksize: int = DHT_KSIZE, alpha: int = DHT_ALPHA):
+        # kademlia's Server.get already crawls iteratively towards the key:
+        # alpha is how many nodes it queries in parallel per step, ksize how
+        # many closest nodes it keeps. The server is only built when the DHT
+        # is joined, and not at all when a saved state is loaded instead
+        self._server: Optional[Server] = None
+        self._ksize = ksize
+        self._alpha = alpha
         self._bootstrap_nodes = bootstrap_nodes
+        self._refcount = 0
+        self._key = _manager_key(bootstrap_nodes, ksize, alpha)
+        # One state file per bootstrap set, so a manager for a private or
+        # local network never warm-starts from, or overwrites, the public
+        # DHT's routing table and node id
+        self._state_path = None
+        if state_dir:
+            name = hashlib.sha1(repr(self._key).encode()).hexdigest()[:16]
+            self._state_path = os.path.join(state_dir, f"dht-{name}.state")
+        self._get_rtts = deque(maxlen=GET_RTT_SAMPLES)
+        self._get_timeout = GET_TIMEOUT
+        # Set once the server is listening. Created on first use so it binds
+        # to the running loop rather than whichever one exists at import.
+        self._started: Optional[asyncio.Event] = None
+        # The server's routing table, bound once the server is up
+        self._router = None
+        self._rebootstrap_handle: Optional[asyncio.TimerHandle] = None
+        self._rebootstrap_task: Optional[asyncio.Task] = None
+        # Serialises joining the DHT, so concurrent users of a shared manager
+        # don't each build and bind a server. Created on first use, like
+        # _started.
+        self._join_lock: Optional[asyncio.Lock] = None
+        self._save_state_handle: Optional[asyncio.TimerHandle] = None
+
+    @classmethod
+    def acquire(cls, bootstrap_nodes: List[Tuple[str, int]] = BT_DHT_DOMAINS,
+                ksize: int = DHT_KSIZE, alpha: int = DHT_ALPHA) -> DHTManager:
+        key = _manager_key(bootstrap_nodes, ksize, alpha)
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(bootstrap_nodes, ksize=ksize, alpha=alpha)
+                cls._instances[key] = instance
+            instance._refcount += 1
+            return instance
+
+    def release(self):
+        if self._drop_ref():
+            self.stop()
+            self._forget()
+
+    async def arelease(self):
+        # Like release(), but writes the DHT state from an executor thread.
+        # The routing table is snapshotted and the server stopped on the loop
+        # that owns them. The manager stays registered until teardown is
+        # done, so a concurrent acquire() reuses it (and rejoins once the
+        # port is free) rather than binding the port next to it.
+        if not self._drop_ref():
+            return
+        async with self._get_join_lock():
+            if self._refcount > 0:
+                # Acquired again while we waited, keep it running
+                return
+            state = self._state_snapshot()
+            self._stop_server()
+            # Let the transport close its socket before anyone rejoins
+            await asyncio.sleep(0)
+            if state is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    IO_EXECUTOR, _write_state, self._state_path, state)
+        self._forget()
+
+    def _drop_ref(self) -> bool:
+        # Returns True when the last user is gone and the server should stop
+        with self._instances_lock:
+            self._refcount -= 1
+            return self._refcount <= 0
+
+    def _forget(self):
+        # Unregisters the manager once it is torn down, unless it was
+        # acquired again in the meantime
+        with self._instances_lock:
+            if self._refcount <= 0 and self._instances.get(self._key) is self:
+                del self._instances[self._key]
+
+    def _state_snapshot(self) -> Optional[Dict[str, Any]]:
+        # The data Server.save_state pickles, read from the live routing table
+        if not self._state_path or not self.is_server_started():
+            return None
+        neighbors = self._server.bootstrappable_neighbors()
+        if not neighbors:
+            return None
+        return {"ksize": self._server.ksize, "alpha": self._server.alpha,
+                "id": self._server.node.id, "neighbors": neighbors}
+
+    def _save_state(self):
+        # Snapshot the routing table here, on the loop that owns it, and
+        # leave pickling and writing it to IO_EXECUTOR
+        state = self._state_snapshot()
+        if state is None:
+            return
+        try:
+            IO_EXECUTOR.submit(_write_state, self._state_path, state)
+        except RuntimeError:
+            # The executor takes no new work once the interpreter is exiting
+            _write_state(self._state_path, state)
+
+    def _save_state_regularly(self):
+        # Replaces kademlia's Server.save_state_regularly, which pickles and
+        # writes the state file on the loop thread
+        self._save_state()
+        self._save_state_handle = asyncio.get_running_loop().call_later(
+            DHT_STATE_SAVE_INTERVAL, self._save_state_regularly)
+
+    def _stop_server(self):
+        self._cancel_rebootstrap()
+        if self._save_state_handle is not None:
+            self._save_state_handle.cancel()
+            self._save_state_handle = None
+        if self._server is not None:
+            self._server.stop()
+        if self._started is not None:
+            self._started.clear()
 
     @classmethod
     async def create(cls, bootstrap_nodes: List[Tuple[str, int]] = None):
-        print("DHTManager.create()")
-        instance = cls(bootstrap_nodes)
+        logging.debug("DHTManager.create()")
+        instance = cls(bootstrap_nodes or BT_DHT_DOMAINS)
         await instance._bootstrap_dht()
         return instance
 
     async def _bootstrap_dht(self):
-        print("DHTManager._bootstrap_dht()")
+        logging.debug("DHTManager._bootstrap_dht()")
+
+        # Shared managers only need to join the DHT once. Later callers wait
+        # for the first one to finish joining.
+        async with self._get_join_lock():
+            if not self.is_server_started():
+                await self._join_dht()
+
+    async def _join_dht(self):
+        # Warm-start from the routing table saved by a previous run and only
+        # fall back to the known nodes if too few of its contacts are alive
+        if not await self._load_state():
+            # Start the server listening on a port
+            self._server = Server(ksize=self._ksize, alpha=self._alpha)
+            await self._server.listen(DHT_PORT)  # or some other port
+        self._router = self._server.protocol.router
+        self._started_event().set()
+
+        if len(self._server.bootstrappable_neighbors()) < self._server.ksize:
+            await self._bootstrap_from_known_nodes()
+
+        if self._state_path:
+            self._save_state_regularly()
+
+        self._schedule_rebootstrap()
+
+    def _schedule_rebootstrap(self):
+        self._rebootstrap_handle = asyncio.get_running_loop().call_later(
+            REBOOTSTRAP_INTERVAL, self._rebootstrap_if_needed)
+
+    def _rebootstrap_if_needed(self):
+        # A node that came up while the network was unreachable, or that has
+        # since lost most of its contacts, rejoins through the known nodes.
+        # kademlia's own hourly refresh can't help once the table is empty.
+        thin = len(self._server.bootstrappable_neighbors()) < self._server.ksize
+        if thin and (self._rebootstrap_task is None or self._rebootstrap_task.done()):
+            self._rebootstrap_task = asyncio.ensure_future(
+                self._bootstrap_from_known_nodes(refresh_dns=True))
+        self._schedule_rebootstrap()
+
+    def _cancel_rebootstrap(self):
+        if self._rebootstrap_handle is not None:
+            self._rebootstrap_handle.cancel()
+            self._rebootstrap_handle = None
+        if self._rebootstrap_task is not None:
+            self._rebootstrap_task.cancel()
+            self._rebootstrap_task = None
+
+    async def _bootstrap_from_known_nodes(self, refresh_dns: bool = False):
+        # Ping the known nodes concurrently, each under its own short
+        # timeout, so one dead or slow router doesn't hold up the others, then
+        # crawl towards our own id from all the nodes that answered. This is
+        # what Server.bootstrap does, minus waiting out the full RPC timeout.
+        # At most BOOTSTRAP_CONCURRENCY pings are in flight, so a long seed
+        # list doesn't flood the socket.
+        sem = asyncio.Semaphore(BOOTSTRAP_CONCURRENCY)
+
+        async def _contact(node: Tuple[str, int]):
+            logging.debug("DHTManager._bootstrap_dht(): node = %s", node)
+            async with sem:
+                # Stop waiting after BOOTSTRAP_NODE_TIMEOUT, but leave the ping
+                # itself to rpcudp's own timeout: cancelling its future makes
+                # rpcudp fail when it later resolves it and leaks the request
+                ping = asyncio.ensure_future(self._server.bootstrap_node(node))
+                try:
+                    return await asyncio.wait_for(asyncio.shield(ping), timeout=BOOTSTRAP_NODE_TIMEOUT)
+                except (asyncio.TimeoutError, OSError) as e:
+                    ping.add_done_callback(_ignore_result)
+                    logging.info(f"Bootstrap node {node[0]}:{node[1]} unreachable: {e!r}")
+                    return None
+
+        # Bootstrap the node by connecting to other known nodes, backing off
+        # with jitter between attempts while none of them answer. Retries,
+        # and re-bootstraps of a thinned-out routing table, resolve the
+        # hostnames again instead of trusting the cached IPs, in case the
+        # routers have moved.
+        for attempt in range(BOOTSTRAP_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(random.uniform(
+                    0, min(BOOTSTRAP_BACKOFF_MAX, BOOTSTRAP_BACKOFF_BASE * 2 ** attempt)))
+            nodes = await self._resolve_bootstrap_nodes(use_cache=not (attempt or refresh_dns))
+            contacts = [contact for contact in await asyncio.gather(*map(_contact, nodes))
+                        if contact is not None]
+            if contacts:
+                spider = NodeSpiderCrawl(self._server.protocol, self._server.node, contacts,
+                                         self._server.ksize, self._server.alpha)
+                await spider.find()
+                return
+        logging.warning("None of the bootstrap nodes answered, retrying in the background")
+
+    async def _resolve_bootstrap_nodes(self, use_cache: bool = True) -> List[Tuple[str, int]]:
+        # Resolve hostnames with the event loop's resolver and cache the IPs
+        # on disk, so later startups skip DNS entirely while the cache is fresh.
+        # The cache file is read and written from an executor thread.
+        # Nodes given as IP literals, like a local peer's listening address,
+        # need neither DNS nor the cache file
+        if all(_is_ip_literal(host) for host, _ in self._bootstrap_nodes):
+            return [tuple(node) for node in self._bootstrap_nodes]
+
+        loop = asyncio.get_running_loop()
+        cache = await loop.run_in_executor(IO_EXECUTOR, _read_bootstrap_cache)
 
-        # Start the server listening on a port
-        await self._server.listen(5678)  # or some other port
+        keys = [f"{host}:{port}" for host, port in self._bootstrap_nodes]
+        if use_cache and all(key in cache for key in keys):
+            return [tuple(cache[key]) for key in keys]
 
-        # Bootstrap the node by connecting to other known nodes
-        for node in self._bootstrap_nodes:
-            print("DHTManager._bootstrap_dht(): node = ", node)
-            await self._server.bootstrap([node])
+        # The server listens on 0.0.0.0, so only IPv4 addresses are reachable
+        results = await asyncio.gather(
+            *(loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+              for host, port in self._bootstrap_nodes),
+            return_exceptions=True)
 
-    def get_routing_table(self) -> List['kademlia.routing.KBucket']:
-        return self._server.protocol.router.buckets
+        resolved = []
+        for key, node, result in zip(keys, self._bootstrap_nodes, results):
+            if isinstance(result, Exception) or not result:
+                # Handing rpcudp the hostname would make sendto() resolve it
+                # with a blocking lookup on the loop. Fall back to the address
+                # cached earlier, or leave the node out this time.
+                logging.warning(f"Failed to resolve bootstrap node {node}: {result}")
+                if key in cache:
+                    resolved.append(tuple(cache[key]))
+                continue
+            cache[key] = result[0][4][:2]
+            resolved.append(cache[key])
+
+        await loop.run_in_executor(IO_EXECUTOR, _write_bootstrap_cache, cache)
+        return resolved
+
+    async def _load_state(self) -> bool:
+        # Server.load_state, except that a server which fails halfway is
+        # stopped again rather than left holding DHT_PORT, so the caller can
+        # fall back to a fresh one
+        if not self._state_path or not os.path.exists(self._state_path):
+            return False
+        loop = asyncio.get_running_loop()
+        server = None
+        try:
+            data = await loop.run_in_executor(IO_EXECUTOR, _read_state, self._state_path)
+            # Only the node id and neighbours carry over. ksize and alpha
+            # come from our configuration, not the previous run's.
+            if data["ksize"] != self._ksize:
+                logging.info(f"Saved DHT state used ksize {data['ksize']}, rebuilding with {self._ksize}")
+            server = Server(ksize=self._ksize, alpha=self._alpha, node_id=data["id"])
+            await server.listen(DHT_PORT)
+            if data["neighbors"]:
+                await server.bootstrap(data["neighbors"])
+        except Exception as e:
+            if server is not None:
+                server.stop()
+                # Let the transport release the port before the fallback
+                await asyncio.sleep(0)
+            logging.warning(f"Failed to load DHT state from {self._state_path}: {e}")
+            return False
+        self._server = server
+        return True
+
+    async def get(self, key: bytes, on_late_result: Optional[Callable[[Any], None]] = None) -> Any:
+        # Give up waiting after the 90th percentile of recent get round trips
+        # rather than a fixed timeout. A query that overruns keeps running in
+        # the background on rpcudp's own timeouts and hands its result to
+        # on_late_result, so late answers aren't lost.
+        # Gets answered from local storage, or with no contacts to ask, never
+        # reach the network: they neither need the timeout nor count towards it
+        if (self._server.storage.get(digest(key)) is not None
+                or not any(map(len, self._router.buckets))):
+            return await self._server.get(key)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        query = asyncio.ensure_future(self._server.get(key))
+        query.add_done_callback(lambda task: self._record_get_rtt(task, loop.time() - started))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(query), timeout=self._get_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        def _on_late_done(task: asyncio.Future) -> None:
+            # Always retrieve the outcome so a timed-out query isn't reported
+            # as a never-retrieved exception
+            if task.cancelled() or task.exception() is not None:
+                return
+            if on_late_result is not None:
+                on_late_result(task.result())
+
+        # Cancelling the crawl would cancel rpcudp futures still in flight,
+        # so let it run to completion instead
+        query.add_done_callback(_on_late_done)
+        return None
+
+    async def get_many(self, keys: List[bytes], on_late_result: Optional[Callable[[bytes, Any], None]] = None,
+                       semaphore: Optional[asyncio.Semaphore] = None) -> List[Any]:
+        # Issue the gets for a batch of keys together so their round trips
+        # overlap, optionally bounded by the caller's semaphore
+        async def _get(key: bytes) -> Any:
+            callback = None
+            if on_late_result is not None:
+                callback = functools.partial(on_late_result, key)
+            if semaphore is None:
+                return await self.get(key, callback)
+            async with semaphore:
+                return await self.get(key, callback)
+
+        return await asyncio.gather(*(_get(key) for key in keys))
+
+    def _record_get_rtt(self, task: asyncio.Future, rtt: float) -> None:
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._get_rtts.append(rtt)
+        # Recompute the percentile every few samples rather than per query
+        if len(self._get_rtts) >= GET_MIN_RTT_SAMPLES and len(self._get_rtts) % GET_MIN_RTT_SAMPLES == 0:
+            p90 = statistics.quantiles(self._get_rtts, n=10)[8]
+            self._get_timeout = min(max(p90, GET_MIN_TIMEOUT), GET_TIMEOUT)
+
+    def get_routing_table(self) -> Sequence['kademlia.routing.KBucket']:
+        # The live bucket list, not a copy, so polling it is free. Callers
+        # must treat it as read-only.
+        if self._router is None:
+            return ()
+        return self._router.buckets
 
     def is_server_started(self) -> bool:
-        return bool(self._server.transport)
+        # Flipped by _bootstrap_dht and stop(), so checking costs no server
+        # attribute walk
+        return self._started is not None and self._started.is_set()
+
+    def _started_event(self) -> asyncio.Event:
+        if self._started is None:
+            self._started = asyncio.Event()
+        return self._started
+
+    def _get_join_lock(self) -> asyncio.Lock:
+        if self._join_lock is None:
+            self._join_lock = asyncio.Lock()
+        return self._join_lock
 
     async def wait_for_server_start(self):
-        while not self._server.transport:
-            await asyncio.sleep(0.1)
+        if not self.is_server_started():
+            await self._started_event().wait()
 
     def stop(self):
-        self._server.stop()
+        self._save_state()
+        self._stop_server()
 
     def get_server(self):
         return self._server
@@ -1,20 +1,22 @@
 import asyncio
-import bitbootpy
+from bitbootpy import BitBoot
 
-bitboot = BitBoot()
 network_names = ["network1", "network2"]
 
-async def main_async():
-    await bitboot.start_continuous_mode(network_names)
 
-# Start the continuous mode in the background
-loop = asyncio.get_event_loop()
-task = loop.create_task(main_async())
+async def main():
+    async with await BitBoot.create(network_names=network_names) as bitboot:
+        # Start the continuous mode in the background
+        task = asyncio.create_task(bitboot.start_continuous_mode(network_names))
 
-# Stop the continuous mode after 60 seconds
-time.sleep(60)
-bitboot.stop_continuous_mode()
+        # Stop the continuous mode after 60 seconds, without blocking the loop
+        await asyncio.sleep(60)
+        for network_name in network_names:
+            bitboot.stop_continuous_mode(network_name)
 
-# Wait for the continuous mode task to finish
-loop.run_until_complete(task)
+        # Wait for the continuous mode task to finish
+        await task
 
+
+if __name__ == "__main__":
+    asyncio.run(main())
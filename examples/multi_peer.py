@@ -17,10 +17,6 @@ async def main():
     )
     creator = await BitBoot.create(config=creator_config)
 
-    while not creator._dht_manager.is_server_started():
-        print("Waiting for server to start...")
-        await asyncio.sleep(0.1)
-
     await creator._dht_manager.wait_for_server_start()
 
     print(f"Announcing network {network_name}..")
@@ -44,7 +40,15 @@ async def main():
         peers[1].lookup_and_announce(creator, network_name, peer_ports[1]),
         peers[2].lookup_and_announce(creator, network_name, peer_ports[2]),
     ]
-    await asyncio.gather(*tasks)
+    # Cap how many peers join at once so a long peer list can't flood the
+    # DHT socket
+    sem = asyncio.Semaphore(16)
+
+    async def limited(coro):
+        async with sem:
+            return await coro
+
+    await asyncio.gather(*(limited(task) for task in tasks))
 
     # Lookup for the joined peers from the creator's perspective
     await creator.lookup(network_names=[network_name])
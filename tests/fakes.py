@@ -0,0 +1,55 @@
+import asyncio
+import functools
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeTransport:
+
+    def get_extra_info(self, name: str) -> Any:
+        return {"sockname": ("127.0.0.1", 5678)}.get(name)
+
+
+class FakeServer:
+    # The parts of kademlia's Server that BitBoot uses directly
+
+    def __init__(self, storage: Dict[bytes, Any]):
+        self.storage = storage
+        self.transport = FakeTransport()
+
+    async def set(self, key: bytes, value: Any) -> bool:
+        if not isinstance(value, (int, float, bool, str, bytes)):
+            raise TypeError("Value must be of type int, float, bool, str, or bytes")
+        self.storage[key] = value
+        return True
+
+
+class FakeDHTManager:
+    # Stands in for DHTManager in BitBoot tests: answers gets from a dict of
+    # info_hash -> stored value and keeps each get's late-result callback
+
+    def __init__(self, results: Optional[Dict[bytes, Any]] = None):
+        self.results = results if results is not None else {}
+        self._server = FakeServer(self.results)
+        self.gets: List[bytes] = []
+        self.late_callbacks: Dict[bytes, Callable[[Any], None]] = {}
+        # Raised, in order, by the next gets
+        self.errors: List[BaseException] = []
+        self.released = False
+
+    async def get(self, key: bytes, on_late_result: Optional[Callable[[Any], None]] = None) -> Any:
+        self.gets.append(key)
+        self.late_callbacks[key] = on_late_result
+        await asyncio.sleep(0)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.results.get(key)
+
+    async def get_many(self, keys: List[bytes], on_late_result: Optional[Callable[[bytes, Any], None]] = None,
+                       semaphore: Optional[asyncio.Semaphore] = None) -> List[Any]:
+        return [await self.get(key, functools.partial(on_late_result, key)) for key in keys]
+
+    def get_server(self) -> FakeServer:
+        return self._server
+
+    async def arelease(self):
+        self.released = True
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from bitbootpy import dht_manager
+from bitbootpy.dht_manager import BOOTSTRAP_ATTEMPTS, BOOTSTRAP_BACKOFF_MAX, DHTManager, _is_ip_literal
+
+ROUTER = ("router.example", 6881)
+
+
+class BootstrapTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(dht_manager, "BOOTSTRAP_CACHE_PATH", os.path.join(tmp.name, "bootstrap.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Answers DNS queries from self.addresses, and IP literals as is
+        self.addresses = {ROUTER[0]: "10.0.0.1"}
+        self.lookups = []
+
+        async def getaddrinfo(host, port, **kwargs):
+            self.lookups.append(host)
+            if _is_ip_literal(host):
+                return [(socket.AF_INET, socket.SOCK_DGRAM, 17, "", (host, port))]
+            if host not in self.addresses:
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            return [(socket.AF_INET, socket.SOCK_DGRAM, 17, "", (self.addresses[host], port))]
+
+        patcher = mock.patch.object(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_resolved_nodes_are_cached(self):
+        manager = DHTManager([ROUTER], state_dir=None)
+        self.assertEqual(await manager._resolve_bootstrap_nodes(), [("10.0.0.1", 6881)])
+        self.addresses[ROUTER[0]] = "10.0.0.2"
+        self.assertEqual(await manager._resolve_bootstrap_nodes(), [("10.0.0.1", 6881)])
+        self.assertEqual(self.lookups, [ROUTER[0]])
+
+    async def test_cache_can_be_skipped(self):
+        manager = DHTManager([ROUTER], state_dir=None)
+        await manager._resolve_bootstrap_nodes()
+        self.addresses[ROUTER[0]] = "10.0.0.2"
+        self.assertEqual(await manager._resolve_bootstrap_nodes(use_cache=False), [("10.0.0.2", 6881)])
+        # The fresh address replaces the cached one
+        self.assertEqual(await manager._resolve_bootstrap_nodes(), [("10.0.0.2", 6881)])
+
+    async def test_unresolved_nodes_are_dropped(self):
+        manager = DHTManager([ROUTER, ("gone.example", 6881), ("10.0.0.9", 6881)], state_dir=None)
+        with self.assertLogs(level="WARNING"):
+            nodes = await manager._resolve_bootstrap_nodes()
+        self.assertEqual(nodes, [("10.0.0.1", 6881), ("10.0.0.9", 6881)])
+
+    async def test_unresolved_node_falls_back_to_cached_address(self):
+        manager = DHTManager([ROUTER], state_dir=None)
+        await manager._resolve_bootstrap_nodes()
+        del self.addresses[ROUTER[0]]
+        with self.assertLogs(level="WARNING"):
+            nodes = await manager._resolve_bootstrap_nodes(use_cache=False)
+        self.assertEqual(nodes, [("10.0.0.1", 6881)])
+
+    async def test_retries_resolve_again_and_back_off(self):
+        manager = DHTManager([ROUTER], state_dir=None)
+        server = mock.Mock()
+        server.bootstrap_node = mock.AsyncMock(return_value=None)
+        manager._server = server
+        with mock.patch.object(DHTManager, "_resolve_bootstrap_nodes", autospec=True,
+                               return_value=[("10.0.0.1", 6881)]) as resolve, \
+                mock.patch("random.uniform", return_value=0) as uniform, \
+                self.assertLogs(level="WARNING"):
+            await manager._bootstrap_from_known_nodes()
+        self.assertEqual([call.kwargs["use_cache"] for call in resolve.call_args_list],
+                         [True] + [False] * (BOOTSTRAP_ATTEMPTS - 1))
+        delays = [call.args[1] for call in uniform.call_args_list]
+        self.assertEqual(len(delays), BOOTSTRAP_ATTEMPTS - 1)
+        self.assertGreaterEqual(delays[0], 1.0)
+        self.assertEqual(delays[-1], BOOTSTRAP_BACKOFF_MAX)
+
+    async def test_rebootstrap_resolves_again(self):
+        manager = DHTManager([ROUTER], state_dir=None)
+        server = mock.Mock()
+        server.bootstrap_node = mock.AsyncMock(return_value=None)
+        manager._server = server
+        with mock.patch.object(DHTManager, "_resolve_bootstrap_nodes", autospec=True,
+                               return_value=[("10.0.0.1", 6881)]) as resolve, \
+                mock.patch.object(dht_manager, "BOOTSTRAP_ATTEMPTS", 1), \
+                self.assertLogs(level="WARNING"):
+            await manager._bootstrap_from_known_nodes(refresh_dns=True)
+        self.assertEqual(resolve.call_args.kwargs, {"use_cache": False})
+
+
+if __name__ == "__main__":
+    unittest.main()
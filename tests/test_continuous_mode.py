@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig, _info_hash
+from bitbootpy.dht_manager import DHTManager
+from tests.fakes import FakeDHTManager
+
+PEER_A = ("10.0.0.1", 1)
+
+
+class ContinuousModeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # _record_peers writes <network>_peers.txt into the working directory
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        os.chdir(tmp.name)
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+
+        # Short rounds and no backoff between retries
+        for patcher in (
+                mock.patch.object(BitBoot, "lookup_many", functools.partialmethod(BitBoot.lookup_many, delay=0.001)),
+                mock.patch("random.uniform", return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.dht = FakeDHTManager()
+        config = BitBootConfig(print_discovered_peers=False, max_retries=2, max_stable_rounds=1,
+                               min_interval=0.01, max_interval=0.02)
+        with mock.patch.object(DHTManager, "acquire", return_value=self.dht):
+            self.bitboot = BitBoot(config, network_names=["net"])
+        self.task = asyncio.ensure_future(self.bitboot.start_continuous_mode())
+
+    async def asyncTearDown(self):
+        self.bitboot.stop_continuous_mode("net")
+        await asyncio.wait_for(self.task, timeout=1)
+        await self.bitboot.aclose()
+
+    async def _until(self, condition):
+        async def _poll():
+            while not condition():
+                await asyncio.sleep(0.001)
+        await asyncio.wait_for(_poll(), timeout=1)
+
+    async def test_transient_errors_are_retried(self):
+        self.dht.errors = [OSError()]
+        self.dht.results[_info_hash("net")] = "10.0.0.1:1"
+        await self._until(lambda: self.bitboot.get_peers("net"))
+        self.assertEqual(self.bitboot.get_peers("net"), [PEER_A])
+
+    async def test_keeps_polling_after_a_failed_lookup(self):
+        self.dht.errors = [OSError(), OSError()]
+        with self.assertLogs(level="ERROR"):
+            await self._until(lambda: len(self.dht.gets) >= 3)
+        self.assertFalse(self.task.done())
+
+    async def test_backs_off_without_new_peers(self):
+        await self._until(lambda: len(self.dht.gets) >= 3)
+        await self._until(lambda: self.bitboot._poll_interval["net"] == 0.02)
+
+    async def test_new_peers_reset_the_interval(self):
+        await self._until(lambda: self.bitboot._poll_interval["net"] == 0.02)
+        self.dht.results[_info_hash("net")] = "10.0.0.1:1"
+        await self._until(lambda: self.bitboot._poll_interval["net"] == 0.01)
+        self.assertEqual(self.bitboot.get_peers("net"), [PEER_A])
+
+
+if __name__ == "__main__":
+    unittest.main()
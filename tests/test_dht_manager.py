@@ -0,0 +1,159 @@
+import asyncio
+import types
+import unittest
+from unittest import mock
+
+from bitbootpy import dht_manager
+from bitbootpy.dht_manager import DHTManager
+
+
+class FakeServer:
+    ksize = 20
+    alpha = 3
+    node = types.SimpleNamespace(id=b"id")
+
+    def __init__(self, on_stop=None):
+        self.stopped = 0
+        self._on_stop = on_stop
+
+    def bootstrappable_neighbors(self):
+        return [("10.0.0.1", 1)]
+
+    def stop(self):
+        self.stopped += 1
+        if self._on_stop is not None:
+            self._on_stop()
+
+
+class DHTManagerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # Stand in for joining the DHT: no sockets, just a started server
+        self.joins = []
+
+        async def _join_dht(manager):
+            self.joins.append(manager)
+            await asyncio.sleep(0)
+            manager._server = FakeServer()
+            manager._started_event().set()
+
+        patcher = mock.patch.object(DHTManager, "_join_dht", _join_dht)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _acquire(self, *nodes, **options) -> DHTManager:
+        manager = DHTManager.acquire(list(nodes), **options)
+        manager._state_path = None
+        return manager
+
+    def test_managers_are_shared_per_bootstrap_set(self):
+        a = self._acquire(("127.0.0.1", 1), ("127.0.0.1", 2))
+        b = self._acquire(("127.0.0.1", 2), ("127.0.0.1", 1))
+        c = self._acquire(("127.0.0.1", 1), ("127.0.0.1", 2), ksize=8)
+        try:
+            self.assertIs(a, b)
+            self.assertIsNot(a, c)
+            self.assertEqual(a._refcount, 2)
+        finally:
+            a.release()
+            b.release()
+            c.release()
+
+    async def test_last_release_stops_and_unregisters(self):
+        manager = self._acquire(("127.0.0.1", 3))
+        self._acquire(("127.0.0.1", 3))
+        await manager._bootstrap_dht()
+        server = manager._server
+
+        manager.release()
+        self.assertEqual(server.stopped, 0)
+        self.assertIs(DHTManager._instances[manager._key], manager)
+
+        manager.release()
+        self.assertEqual(server.stopped, 1)
+        self.assertFalse(manager.is_server_started())
+        self.assertNotIn(manager._key, DHTManager._instances)
+
+    async def test_concurrent_joins_join_once(self):
+        manager = self._acquire(("127.0.0.1", 4))
+        try:
+            await asyncio.gather(manager._bootstrap_dht(), manager._bootstrap_dht())
+            self.assertEqual(self.joins, [manager])
+            self.assertTrue(manager.is_server_started())
+        finally:
+            manager.release()
+
+
+    async def test_arelease_keeps_manager_registered_until_stopped(self):
+        manager = self._acquire(("127.0.0.1", 5))
+        await manager._bootstrap_dht()
+        registered = []
+        manager._server = FakeServer(
+            on_stop=lambda: registered.append(manager._key in DHTManager._instances))
+
+        await manager.arelease()
+        self.assertEqual(registered, [True])
+        self.assertNotIn(manager._key, DHTManager._instances)
+
+    async def test_acquire_while_waiting_to_release_keeps_server(self):
+        manager = self._acquire(("127.0.0.1", 6))
+        await manager._bootstrap_dht()
+        server = manager._server
+
+        async with manager._get_join_lock():
+            release = asyncio.ensure_future(manager.arelease())
+            await asyncio.sleep(0)
+            self.assertIs(self._acquire(("127.0.0.1", 6)), manager)
+        await release
+        self.assertEqual(server.stopped, 0)
+        self.assertTrue(manager.is_server_started())
+
+        await manager.arelease()
+        self.assertEqual(server.stopped, 1)
+        self.assertNotIn(manager._key, DHTManager._instances)
+
+    async def test_acquire_during_teardown_rejoins(self):
+        manager = self._acquire(("127.0.0.1", 7))
+        await manager._bootstrap_dht()
+        server = manager._server
+
+        release = asyncio.ensure_future(manager.arelease())
+        # Let arelease() stop the server and wait for the socket to close
+        await asyncio.sleep(0)
+        self.assertEqual(server.stopped, 1)
+        again = self._acquire(("127.0.0.1", 7))
+        self.assertIs(again, manager)
+        await asyncio.gather(release, again._bootstrap_dht())
+        try:
+            self.assertEqual(self.joins, [manager, manager])
+            self.assertTrue(manager.is_server_started())
+            self.assertIs(DHTManager._instances[manager._key], manager)
+        finally:
+            await manager.arelease()
+
+
+    async def test_release_writes_state_from_the_executor(self):
+        manager = self._acquire(("127.0.0.1", 8))
+        await manager._bootstrap_dht()
+        manager._state_path = "dht.state"
+        with mock.patch.object(dht_manager, "IO_EXECUTOR") as executor:
+            manager.release()
+        executor.submit.assert_called_once_with(dht_manager._write_state, "dht.state", {
+            "ksize": 20, "alpha": 3, "id": b"id", "neighbors": [("10.0.0.1", 1)]})
+
+    async def test_state_is_saved_regularly_from_the_executor(self):
+        manager = self._acquire(("127.0.0.1", 9))
+        await manager._bootstrap_dht()
+        manager._state_path = "dht.state"
+        with mock.patch.object(dht_manager, "IO_EXECUTOR") as executor:
+            manager._save_state_regularly()
+            self.assertEqual(executor.submit.call_count, 1)
+            self.assertIsNotNone(manager._save_state_handle)
+            manager.release()
+        # One last save on release, and the timer is cancelled
+        self.assertEqual(executor.submit.call_count, 2)
+        self.assertIsNone(manager._save_state_handle)
+
+
+if __name__ == "__main__":
+    unittest.main()
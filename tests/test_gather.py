@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+
+from bitbootpy.bitbootpy import gather_cancel_on_error
+
+
+class GatherCancelOnErrorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_results_in_order(self):
+        async def value(result, delay):
+            await asyncio.sleep(delay)
+            return result
+
+        self.assertEqual(await gather_cancel_on_error([value(1, 0.01), value(2, 0)]), [1, 2])
+
+    async def test_failure_waits_for_cancelled_siblings(self):
+        unwound = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # Cleanup that needs the loop still runs before the error
+                # reaches the caller
+                await asyncio.sleep(0)
+                unwound.append(True)
+                raise
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await gather_cancel_on_error([slow(), fail()])
+        self.assertEqual(unwound, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from bitbootpy.dht_manager import (DHTManager, GET_MIN_RTT_SAMPLES, GET_MIN_TIMEOUT,
+                                   GET_RTT_SAMPLES, GET_TIMEOUT)
+
+
+class GetTimeoutTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.manager = DHTManager([("127.0.0.1", 1)])
+
+    def _record(self, *rtts: float, exc: BaseException = None) -> None:
+        loop = asyncio.get_running_loop()
+        for rtt in rtts:
+            task = loop.create_future()
+            if exc is None:
+                task.set_result(None)
+            else:
+                task.set_exception(exc)
+            self.manager._record_get_rtt(task, rtt)
+
+    async def test_default_until_enough_samples(self):
+        self._record(*[2.0] * (GET_MIN_RTT_SAMPLES - 1))
+        self.assertEqual(self.manager._get_timeout, GET_TIMEOUT)
+
+    async def test_p90_of_recent_gets(self):
+        rtts = [1.0 + i * 0.25 for i in range(GET_MIN_RTT_SAMPLES)]
+        self._record(*rtts)
+        self.assertAlmostEqual(self.manager._get_timeout, 4.575)
+
+    async def test_clamped_to_minimum(self):
+        self._record(*[0.01] * GET_MIN_RTT_SAMPLES)
+        self.assertEqual(self.manager._get_timeout, GET_MIN_TIMEOUT)
+
+    async def test_clamped_to_maximum(self):
+        self._record(*[GET_TIMEOUT * 2] * GET_MIN_RTT_SAMPLES)
+        self.assertEqual(self.manager._get_timeout, GET_TIMEOUT)
+
+    async def test_failed_gets_are_ignored(self):
+        self._record(*[2.0] * GET_MIN_RTT_SAMPLES, exc=OSError())
+        self.assertEqual(len(self.manager._get_rtts), 0)
+        self.assertEqual(self.manager._get_timeout, GET_TIMEOUT)
+
+    async def test_only_recent_samples_count(self):
+        self._record(*[8.0] * GET_RTT_SAMPLES)
+        self._record(*[2.0] * GET_RTT_SAMPLES)
+        self.assertEqual(self.manager._get_timeout, 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
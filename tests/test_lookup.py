@@ -0,0 +1,87 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig, _decode_peers, _info_hash
+from bitbootpy.dht_manager import DHTManager
+from tests.fakes import FakeDHTManager
+
+PEER_A = ("10.0.0.1", 1)
+PEER_B = ("10.0.0.2", 1)
+
+
+class LookupTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # _record_peers writes <network>_peers.txt into the working directory
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        os.chdir(tmp.name)
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+
+        self.dht = FakeDHTManager({_info_hash("net"): "10.0.0.1:1", _info_hash("other"): "10.0.0.2:1"})
+        config = BitBootConfig(print_discovered_peers=False, max_retries=1, max_stable_rounds=1)
+        with mock.patch.object(DHTManager, "acquire", return_value=self.dht):
+            self.bitboot = BitBoot(config, network_names=["net", "other"])
+
+    async def asyncTearDown(self):
+        await self.bitboot.aclose()
+
+    async def test_lookup_records_and_caches_peers(self):
+        await self.bitboot.lookup("net", num_searches=3, delay=0.01)
+        self.assertEqual(self.bitboot.get_peers("net"), [PEER_A])
+        self.assertEqual(self.bitboot._get_cached_peers(_info_hash("net")), {PEER_A})
+        with open("net_peers.txt") as f:
+            self.assertEqual(f.read(), f"{PEER_A}\n")
+
+    async def test_default_deadline_covers_zero_delay(self):
+        await self.bitboot.lookup("net", num_searches=3, delay=0)
+        # The second round found nothing new, which ends the lookup early
+        self.assertEqual(len(self.dht.gets), 2)
+        self.assertEqual(self.bitboot._get_cached_peers(_info_hash("net")), {PEER_A})
+
+    async def test_query_slot_is_free_between_rounds(self):
+        self.bitboot._config.max_concurrent_queries = 1
+        self.bitboot._config.max_stable_rounds = 2
+        lookup = asyncio.ensure_future(self.bitboot.lookup(["net", "other"], num_searches=2, delay=0.05))
+        await asyncio.sleep(0.02)
+        # Both networks ran their first round while the other waited
+        self.assertEqual(len(self.dht.gets), 2)
+        self.assertFalse(self.bitboot._get_query_sem().locked())
+        await lookup
+        self.assertEqual(len(self.dht.gets), 4)
+
+    async def test_late_answers_leave_the_cached_result_alone(self):
+        await self.bitboot.lookup("net", num_searches=1, delay=0.01)
+        self.dht.late_callbacks[_info_hash("net")]("10.0.0.2:1")
+        # The late peer is known, but the cached lookup result is a snapshot
+        self.assertEqual(set(self.bitboot.get_peers("net")), {PEER_A, PEER_B})
+        self.assertEqual(self.bitboot._get_cached_peers(_info_hash("net")), {PEER_A})
+
+    async def test_lookup_many_writes_snapshots(self):
+        with mock.patch("bitbootpy.bitbootpy._write_peers") as write_peers:
+            await self.bitboot.lookup_many(["net", "other"], num_searches=1, delay=0)
+        found, _, _ = write_peers.call_args[0]
+        self.assertEqual(found, [("net", {PEER_A}), ("other", {PEER_B})])
+        self.assertTrue(all(isinstance(peers, frozenset) for _, peers in found))
+
+
+    async def test_announced_peer_is_found(self):
+        await self.bitboot.announce_peer("fresh", port=6881)
+        self.assertEqual(self.dht.results[_info_hash("fresh")], "127.0.0.1:6881")
+        await self.bitboot.lookup("fresh", num_searches=1, delay=0)
+        self.assertEqual(self.bitboot.get_peers("fresh"), [("127.0.0.1", 6881)])
+
+    def test_decode_peers(self):
+        self.assertEqual(_decode_peers("10.0.0.1:1"), [PEER_A])
+        self.assertEqual(_decode_peers(b"10.0.0.1:1"), [PEER_A])
+        self.assertEqual(_decode_peers("::1:6881"), [("::1", 6881)])
+        for value in (None, 1, "10.0.0.1", "10.0.0.1:", ":1", "10.0.0.1:x"):
+            self.assertEqual(_decode_peers(value), [], value)
+
+
+if __name__ == "__main__":
+    unittest.main()
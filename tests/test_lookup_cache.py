@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+import unittest
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig
+
+
+class LookupCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # _record_peers writes <network>_peers.txt into the working directory
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        os.chdir(tmp.name)
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+        self.bitboot = self._make_bitboot()
+
+    async def asyncTearDown(self):
+        await self.bitboot.aclose()
+
+    def _make_bitboot(self, **options):
+        options.setdefault("lookup_cache_size", 2)
+        config = BitBootConfig(
+            bootstrap_nodes=[("127.0.0.1", 1)], print_discovered_peers=False, **options)
+        return BitBoot(config)
+
+    def test_cached_peers_are_returned(self):
+        peers = {("10.0.0.1", 1)}
+        self.bitboot._cache_peers(b"a", peers)
+        self.assertEqual(self.bitboot._get_cached_peers(b"a"), peers)
+        self.assertIsNone(self.bitboot._get_cached_peers(b"b"))
+
+    def test_expired_entries_are_dropped(self):
+        self.bitboot._lookup_cache[b"a"] = (time.monotonic() - 301, {("10.0.0.1", 1)})
+        self.assertIsNone(self.bitboot._get_cached_peers(b"a"))
+        self.assertNotIn(b"a", self.bitboot._lookup_cache)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.bitboot._cache_peers(b"a", {("10.0.0.1", 1)})
+        self.bitboot._cache_peers(b"b", {("10.0.0.2", 1)})
+        # Reading an entry makes it the most recently used one
+        self.bitboot._get_cached_peers(b"a")
+        self.bitboot._cache_peers(b"c", {("10.0.0.3", 1)})
+        self.assertEqual(list(self.bitboot._lookup_cache), [b"a", b"c"])
+
+    async def test_bypass_cache(self):
+        bitboot = self._make_bitboot(bypass_cache=True)
+        try:
+            bitboot._cache_peers(b"a", {("10.0.0.1", 1)})
+            self.assertIsNone(bitboot._get_cached_peers(b"a"))
+        finally:
+            await bitboot.aclose()
+
+    async def test_lookup_is_served_from_cache(self):
+        info_hash = self.bitboot._generate_info_hash("net")
+        peers = {("10.0.0.1", 1)}
+        self.bitboot._cache_peers(info_hash, peers)
+        # The DHT was never joined, so this only succeeds on a cache hit
+        await self.bitboot._lookup_single("net", 1, 0)
+        self.assertEqual(set(self.bitboot._discovered_peers["net"]), peers)
+
+    async def test_complete_results_are_cached(self):
+        peers = {("10.0.0.1", 1)}
+        await self.bitboot._record_peers([("net", b"a", peers)])
+        self.assertEqual(self.bitboot._get_cached_peers(b"a"), peers)
+
+    async def test_empty_results_are_not_cached(self):
+        await self.bitboot._record_peers([("net", b"a", set())])
+        self.assertNotIn(b"a", self.bitboot._lookup_cache)
+
+    async def test_truncated_results_are_not_cached(self):
+        peers = {("10.0.0.1", 1)}
+        await self.bitboot._record_peers([("net", b"a", peers)], cacheable=False)
+        self.assertNotIn(b"a", self.bitboot._lookup_cache)
+        # The peers are still remembered for the network
+        self.assertEqual(self.bitboot.get_peers("net"), [("10.0.0.1", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
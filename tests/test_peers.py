@@ -0,0 +1,49 @@
+import time
+import unittest
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig
+
+
+class DiscoveredPeersTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.bitboot = BitBoot(
+            BitBootConfig(bootstrap_nodes=[("127.0.0.1", 1)], peer_ttl=60),
+            network_names=["net", "other"])
+
+    async def asyncTearDown(self):
+        await self.bitboot.aclose()
+
+    def _seen(self, network_name: str, peer: tuple, ago: float) -> None:
+        self.bitboot._discovered_peers.setdefault(network_name, {})[peer] = time.monotonic() - ago
+
+    def test_configured_networks_start_empty(self):
+        self.assertEqual(self.bitboot.num_peers(), {"net": 0, "other": 0})
+        self.assertEqual(self.bitboot.get_peers("net"), [])
+
+    def test_freshest_peers_first(self):
+        self._seen("net", ("10.0.0.1", 1), 30)
+        self._seen("net", ("10.0.0.2", 1), 10)
+        self._seen("net", ("10.0.0.3", 1), 20)
+        self.assertEqual(self.bitboot.get_peers("net"),
+                         [("10.0.0.2", 1), ("10.0.0.3", 1), ("10.0.0.1", 1)])
+
+    def test_seeing_a_peer_again_refreshes_it(self):
+        self._seen("net", ("10.0.0.1", 1), 30)
+        self._seen("net", ("10.0.0.2", 1), 10)
+        self.bitboot._remember_peers("net", {("10.0.0.1", 1)})
+        self.assertEqual(self.bitboot.get_peers("net"), [("10.0.0.1", 1), ("10.0.0.2", 1)])
+
+    def test_stale_peers_expire(self):
+        self._seen("net", ("10.0.0.1", 1), 120)
+        self._seen("net", ("10.0.0.2", 1), 10)
+        self._seen("other", ("10.0.0.3", 1), 120)
+        self.assertEqual(self.bitboot.num_peers(), {"net": 1, "other": 0})
+        self.assertEqual(self.bitboot.get_peers("net"), [("10.0.0.2", 1)])
+
+    def test_unknown_network(self):
+        self.assertEqual(self.bitboot.get_peers("missing"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
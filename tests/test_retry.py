@@ -0,0 +1,86 @@
+import functools
+import gc
+import unittest
+import weakref
+from unittest import mock
+
+from bitbootpy.bitbootpy import BitBoot, BitBootConfig, _pending_releases, _with_retry
+
+
+class RetryTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.bitboot = BitBoot(BitBootConfig(bootstrap_nodes=[("127.0.0.1", 1)], max_retries=3))
+        # No backoff between attempts
+        patcher = mock.patch("random.uniform", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.bitboot.aclose()
+
+    def _failing(self, failures: int, exc: BaseException):
+        calls = []
+
+        @_with_retry("failed")
+        async def fn(owner, value):
+            calls.append(value)
+            if len(calls) <= failures:
+                raise exc
+            return value
+
+        return functools.partial(fn, self.bitboot), calls
+
+    async def test_success_needs_one_call(self):
+        fn, calls = self._failing(0, OSError())
+        self.assertEqual(await fn("x"), "x")
+        self.assertEqual(calls, ["x"])
+
+    async def test_retries_until_success(self):
+        fn, calls = self._failing(2, OSError())
+        self.assertEqual(await fn("x"), "x")
+        self.assertEqual(len(calls), 3)
+
+    async def test_gives_up_after_max_retries(self):
+        fn, calls = self._failing(10, RuntimeError())
+        with self.assertLogs(level="ERROR") as logs:
+            self.assertIsNone(await fn("x"))
+        self.assertEqual(len(calls), 3)
+        self.assertIn("failed", logs.output[0])
+
+    async def test_at_least_one_attempt(self):
+        self.bitboot._config.max_retries = 0
+        fn, calls = self._failing(0, OSError())
+        self.assertEqual(await fn("x"), "x")
+        self.assertEqual(len(calls), 1)
+
+    async def test_other_errors_are_not_retried(self):
+        fn, calls = self._failing(1, ValueError())
+        with self.assertRaises(ValueError):
+            await fn("x")
+        self.assertEqual(len(calls), 1)
+
+    async def test_max_retries_is_read_at_call_time(self):
+        fn, calls = self._failing(10, OSError())
+        self.bitboot._config.max_retries = 2
+        with self.assertLogs(level="ERROR"):
+            await fn("x")
+        self.assertEqual(len(calls), 2)
+
+    async def test_instances_are_freed_without_the_cyclic_gc(self):
+        bitboot = BitBoot(BitBootConfig(bootstrap_nodes=[("127.0.0.1", 1)]))
+        ref = weakref.ref(bitboot)
+        gc.disable()
+        try:
+            del bitboot
+            self.assertIsNone(ref())
+        finally:
+            gc.enable()
+        # The finalizer released the DHT from this loop
+        self.assertEqual(len(_pending_releases), 1)
+        for task in list(_pending_releases):
+            await task
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bitbootpy.bitbootpy import _write_peers
+
+
+class WritePeersTest(unittest.TestCase):
+
+    def setUp(self):
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        os.chdir(tmp.name)
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+
+    def _read(self, path: str) -> str:
+        with open(path) as f:
+            return f.read()
+
+    def test_one_file_per_network(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            _write_peers([("a", [("10.0.0.1", 1), ("10.0.0.2", 2)]), ("b", [])], "now", False)
+        self.assertEqual(self._read("a_peers.txt"), "('10.0.0.1', 1)\n('10.0.0.2', 2)\n")
+        self.assertEqual(self._read("b_peers.txt"), "")
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_files_are_overwritten(self):
+        with open("a_peers.txt", "w") as f:
+            f.write("old\n")
+        _write_peers([("a", [("10.0.0.1", 1)])], "now", False)
+        self.assertEqual(self._read("a_peers.txt"), "('10.0.0.1', 1)\n")
+
+    def test_verbose_output(self):
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            _write_peers([("a", [("10.0.0.1", 1), ("10.0.0.2", 2)]), ("b", []), ("c", [("10.0.0.3", 3)])],
+                         "2023-01-01 00:00:00", True)
+        self.assertEqual(stdout.getvalue(),
+                         "[2023-01-01 00:00:00] a: ('10.0.0.1', 1)\n"
+                         "[2023-01-01 00:00:00] a: ('10.0.0.2', 2)\n"
+                         "[2023-01-01 00:00:00] c: ('10.0.0.3', 3)\n")
+
+
+if __name__ == "__main__":
+    unittest.main()